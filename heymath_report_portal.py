@@ -1,10 +1,12 @@
 # pip install streamlit requests pandas openpyxl
+import functools
 import io
 import json
 import os
 import re
 import subprocess
 import zipfile
+from collections import deque
 from datetime import date
 from pathlib import Path
 from datetime import datetime
@@ -20,55 +22,244 @@ OUTDIR_BASE.mkdir(parents=True, exist_ok=True)
 st.set_page_config(page_title="HeyMath Reports Config", page_icon="📊", layout="centered")
 st.title("HeyMath! Reports — Setup")
 
-st.caption({"OS": platform.platform(),
+@st.cache_data(show_spinner=False)
+def env_info() -> dict:
+    """Host details for the header caption — computed once, not on every rerun."""
+    return {"OS": platform.platform(),
             "TMP": tempfile.gettempdir(),
-            "Can write /tmp": os.access("/tmp", os.W_OK)})
+            "Can write /tmp": os.access("/tmp", os.W_OK)}
+
+st.caption(env_info())
 # ========= Config =========
 EXCEL_PATH = "School_Details_filled_with_subjects_final.xlsx"  # adjust path if needed
 EXCEL_PATH1 = "School_Details_filled_with_MathsLabsubjects_final.xlsx"  # adjust path if needed
 SUBJECT_MAX = 10  # SubjectCode 1..SubjectCode 10
 
+# Only these master columns are used (matched like pick_col_ci); the rest are never parsed
+NEEDED_COLUMNS = (["SchoolName", "School Name", "School", "School Details",
+                   "ShortCode", "Short Code", "School Short Code", "SchoolShortCode",
+                   "GradeLabel", "Grade Label", "LevelLabel", "Grade"]
+                  + [f"SubjectCode {i}" for i in range(1, SUBJECT_MAX + 1)])
+
+SCHOOL_FILTER_THRESHOLD = 200  # above this many schools, show a filter box before the picker
+SCHOOL_FILTER_LIMIT = 100      # max options handed to the picker once filtering kicks in
+LOG_TAIL_LINES = 200           # runner output lines shown (and kept) while a run streams
+
+# Prefer the Rust-backed calamine reader (much faster cold start); fall back to openpyxl
+try:
+    import python_calamine  # noqa: F401
+    XLSX_ENGINE = "calamine"
+except ImportError:
+    XLSX_ENGINE = "openpyxl"
+
+SHORT_CODE_KEY = "_sc_key"  # index name of load_master() frames: casefolded ShortCode
+
 # ========= Helpers =========
+_SLUG_RE = re.compile(r"[^A-Za-z0-9._-]+")
+_NORM_RE = re.compile(r"[^a-z0-9]+")
+
+def norm_col(s) -> str:
+    """Column name reduced to lowercase alphanumerics ('School Short Code' -> 'schoolshortcode')."""
+    return _NORM_RE.sub("", str(s).lower())
+
+def file_mtime(path: str) -> float:
+    """Modification time of path (0.0 if missing) — used to key the Excel caches."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+def read_master_excel(path: str) -> pd.DataFrame:
+    """Read just the NEEDED_COLUMNS of a master Excel (a cheap header-only pass picks them)."""
+    wanted = {norm_col(c) for c in NEEDED_COLUMNS}
+    header = pd.read_excel(path, nrows=0, engine=XLSX_ENGINE).columns
+    usecols = [c for c in header
+               if norm_col(c) in wanted or ("short" in norm_col(c) and "code" in norm_col(c))]
+    return pd.read_excel(path, usecols=usecols or None, engine=XLSX_ENGINE)
+
 @st.cache_data(show_spinner=False)
-def load_master(path: str) -> pd.DataFrame:
-    if not Path(path).exists():
+def load_master(path: str, mtime: float = 0.0) -> pd.DataFrame:
+    """
+    Parse a master Excel. A .feather sidecar next to the XLSX is used when it is
+    at least as new as the workbook (written on first parse, refreshed when the
+    XLSX changes). `mtime` only keys Streamlit's cache so edits invalidate it.
+    """
+    src = Path(path)
+    if not src.exists():
         st.error(f"Master Excel not found: {path}")
         return pd.DataFrame()
-    df = pd.read_excel(path)
-    df.columns = [str(c).strip() for c in df.columns]
+    cache = src.with_suffix(".feather")
+    df = None
+    if cache.exists() and cache.stat().st_mtime >= src.stat().st_mtime:
+        try:
+            df = pd.read_feather(cache)
+        except Exception:
+            df = None  # unreadable sidecar -> fall back to the XLSX
+    if df is None:
+        df = read_master_excel(path)
+        df.columns = [str(c).strip() for c in df.columns]
+        try:
+            tmp = cache.with_suffix(".feather.tmp")
+            df.reset_index(drop=True).to_feather(tmp)
+            os.replace(tmp, cache)
+        except Exception:
+            pass  # read-only checkout / unsupported column types: just skip the sidecar
+
+    # Index on the normalised short code so per-school lookups are a hash probe
+    short_col = pick_col_ci(df, "ShortCode", "Short Code", "School Short Code", "SchoolShortCode")
+    if short_col:
+        df.index = pd.Index(df[short_col].astype("string").str.strip().str.casefold(), name=SHORT_CODE_KEY)
     return df
 
+def rows_for_short_code(df: pd.DataFrame, short_code: str) -> pd.DataFrame:
+    """Rows of a load_master() frame for short_code (case/space-insensitive)."""
+    key = short_code.strip().casefold()
+    if df.index.name != SHORT_CODE_KEY or key not in df.index:
+        return df.iloc[0:0].copy()
+    return df.loc[[key]].copy()
+
+def session_rows(label: str, mtime: float, short_code: str, compute):
+    """
+    Per-session memo of one school's rows: reruns for the same school (date or
+    token edits) reuse the frame from st.session_state instead of re-filtering.
+    Keyed on the workbook mtime so a replaced Excel is picked up. Treat as read-only.
+    """
+    key = f"rows_{label}_{mtime}_{short_code.strip().casefold()}"
+    if key not in st.session_state:
+        st.session_state[key] = compute()
+    return st.session_state[key]
+
+@st.cache_data(show_spinner=False)
+def load_ml_for(path: str, mtime: float, short_code: str) -> pd.DataFrame | None:
+    """
+    Maths Lab rows for one school, loaded lazily after a school is picked.
+    Returns None when the sheet has no recognisable Short Code column.
+    """
+    ml_df = load_master(path, mtime)
+    if ml_df.index.name != SHORT_CODE_KEY:
+        return None
+    return rows_for_short_code(ml_df, short_code)
+
+def canonical_master(df: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Main sheet with canonical SchoolName / ShortCode / GradeLabel headers
+    (tolerant to “School Details”, “School Short Code”, etc.).
+    Returns None when the school name or short code column is missing.
+    """
+    name_col  = pick_col_ci(df, "SchoolName", "School Name", "School Details", "School")
+    short_col = pick_col_ci(df, "ShortCode", "Short Code", "School Short Code", "SchoolShortCode")
+    grade_col = pick_col_ci(df, "GradeLabel", "Grade Label", "LevelLabel", "Grade")
+    if not name_col or not short_col:
+        return None
+    return df.rename(columns={
+        name_col:  "SchoolName",
+        short_col: "ShortCode",
+        **({grade_col: "GradeLabel"} if grade_col else {})
+    })
+
+def _schools_df(master_df: pd.DataFrame) -> pd.DataFrame:
+    """Unique (SchoolName, ShortCode) pairs sorted by school name, as shown in the picker."""
+    return (master_df[["SchoolName", "ShortCode"]].dropna().drop_duplicates()
+            .sort_values("SchoolName", key=lambda s: s.astype(str).str.lower(), kind="stable"))
+
+@st.cache_data(show_spinner=False)
+def load_school_directory(master_path: str, master_mtime: float) -> dict:
+    """
+    What the page needs before a school is picked, cached per workbook version:
+    the sheet shape and the sorted picker options (None if the name/short code
+    columns are missing). The full frame itself never leaves the cache.
+    """
+    master_df = load_master(master_path, master_mtime)
+    directory = {"shape": master_df.shape, "school_options": None}
+    master_df = canonical_master(master_df)
+    if master_df is not None:
+        schools_df = _schools_df(master_df)
+        directory["school_options"] = (schools_df["ShortCode"].astype(str) + " — "
+                                       + schools_df["SchoolName"].astype(str)).tolist()
+    return directory
+
+@st.cache_data(show_spinner=False)
+def derive_school_context(master_path: str, master_mtime: float, short_code: str) -> dict:
+    """
+    Everything derived from the main sheet for one school: its display name and
+    rows, the grade label base, the level range detected from the populated
+    SubjectCode columns, and the grade label <-> level code maps.
+    Cached on (path, mtime, short_code) so reruns for the same school are a lookup.
+    """
+    master_df = canonical_master(load_master(master_path, master_mtime))
+    school_row = rows_for_short_code(_schools_df(master_df), short_code).iloc[0]
+    school_rows = rows_for_short_code(master_df, short_code)
+
+    # ---------- Build grade labels by scanning SubjectCode columns ----------
+    base_label = (
+        school_rows["GradeLabel"].dropna().astype(str).str.strip().iloc[0]
+        if "GradeLabel" in school_rows.columns and not school_rows["GradeLabel"].dropna().empty
+        else "Grade"
+    )
+
+    has_data = subject_block(school_rows, range(1, SUBJECT_MAX + 1)).notna().any(axis=0)
+    indices_with_data = [i for i in range(1, SUBJECT_MAX + 1) if has_data.get(f"SubjectCode {i}", False)]
+
+    if indices_with_data:
+        start_idx = min(indices_with_data)
+        end_idx   = max(indices_with_data)
+    else:
+        start_idx, end_idx = 1, 12  # fallback
+
+    return {
+        "school_name": str(school_row.SchoolName).strip(),
+        "school_rows": school_rows,
+        "base_label": base_label,
+        "start_idx": start_idx,
+        "end_idx": end_idx,
+        "grade_labels": [f"{base_label} {i}" for i in range(start_idx, end_idx + 1)],
+        "label_to_code": {f"{base_label} {i}": f"{i:02d}" for i in range(start_idx, end_idx + 1)},
+    }
+
 def ddmmyyyy(d: date) -> str:
     return d.strftime("%d/%m/%Y")
 
-def subject_for_grade_wide(school_df: pd.DataFrame, grade_label: str) -> str:
+def subject_block(school_df: pd.DataFrame, indices) -> pd.DataFrame:
     """
     Your sheet is 'wide': columns are SubjectCode 1..SubjectCode N.
-    We extract the number from grade_label (e.g., 'Grade 2' -> 2),
-    then read that SubjectCode column. If multiple rows exist for school,
-    take the first non-empty value in that column.
+    Returns the present SubjectCode columns for `indices` as stripped strings,
+    with blank/'nan'/'none' cells masked to NA, so callers can test or pick
+    values for every level at once.
     """
-    m = re.search(r"(\d+)", str(grade_label))
-    if not m:
-        return ""
-    idx = int(m.group(1))
-    col = f"SubjectCode {idx}"
-    if col not in school_df.columns:
-        return ""
-    vals = school_df[col].dropna().astype(str).str.strip()
-    return vals.iloc[0] if not vals.empty and vals.iloc[0] else ""
+    cols = [f"SubjectCode {i}" for i in indices if f"SubjectCode {i}" in school_df.columns]
+    block = school_df[cols].astype("string")
+    if not cols:
+        return block
+    block = block.apply(lambda s: s.str.strip())
+    return block.mask(block.apply(lambda s: s.str.lower()).isin(["", "nan", "none"]))
+
+def subject_codes_wide(school_df: pd.DataFrame, indices) -> dict:
+    """
+    Returns {"02": "<uuid>", ...} for the given level indices in one pass;
+    bfill().iloc[0] takes the first non-empty value per column when a
+    school has multiple rows.
+    """
+    block = subject_block(school_df, indices)
+    if block.empty or block.columns.empty:
+        return {}
+    first = block.bfill().iloc[0]
+    return {f"{i:02d}": first[f"SubjectCode {i}"] for i in indices
+            if f"SubjectCode {i}" in first.index and pd.notna(first[f"SubjectCode {i}"])}
 
 def safe_date_str(d: date) -> str:
     return d.strftime("%d-%m-%Y")
 
 def slug(s: str) -> str:
-    return re.sub(r"[^A-Za-z0-9._-]+", "", (s or "").replace(" ", "_"))
+    return _SLUG_RE.sub("", (s or "").replace(" ", "_"))
+
+@functools.lru_cache(maxsize=32)
+def _col_cmap(cols: tuple) -> dict:
+    """Normalised -> original column names; memoised since master headers never change."""
+    return {norm_col(c): c for c in cols}
 
-import re
 def pick_col_ci(df, *preferred_names):
     """Case/space/underscore-insensitive column picker."""
-    def norm_col(s): return re.sub(r'[^a-z0-9]+', '', str(s).lower())
-    cmap = {norm_col(c): c for c in df.columns}
+    cmap = _col_cmap(tuple(df.columns))
 
     # try exact preferred names
     for name in preferred_names:
@@ -84,48 +275,27 @@ def pick_col_ci(df, *preferred_names):
 # ========= Load Excel =========
 
 # --- Main master (required) ---
-master_df = load_master(EXCEL_PATH)
-st.write(f"✅ Loaded Excel with {master_df.shape[0]} rows and {master_df.shape[1]} columns")
-if master_df.empty:
+master_mtime = file_mtime(EXCEL_PATH)
+directory = load_school_directory(EXCEL_PATH, master_mtime)
+n_rows, n_cols = directory["shape"]
+st.write(f"✅ Loaded Excel with {n_rows} rows and {n_cols} columns")
+if not n_rows or not n_cols:
     st.error("The main School Details Excel is empty. Please upload a valid file.")
     st.stop()
-master_df.columns = [str(c).strip() for c in master_df.columns]
-
-# Canonicalise main headers (tolerant to “School Details”, “School Short Code”, etc.)
-name_col  = pick_col_ci(master_df, "SchoolName", "School Name", "School Details", "School")
-short_col = pick_col_ci(master_df, "ShortCode", "Short Code", "School Short Code", "SchoolShortCode")
-grade_col = pick_col_ci(master_df, "GradeLabel", "Grade Label", "LevelLabel", "Grade")
-
-if not name_col or not short_col:
+if directory["school_options"] is None:
     st.error("Missing school name / short code columns in the main Excel.")
     st.stop()
-
-master_df = master_df.rename(columns={
-    name_col:  "SchoolName",
-    short_col: "ShortCode",
-    **({grade_col: "GradeLabel"} if grade_col else {})
-})
-
-# --- Maths Lab master (optional) ---
-ml_master_df = pd.DataFrame()
-if EXCEL_PATH1 and os.path.exists(EXCEL_PATH1):
-    ml_master_df = load_master(EXCEL_PATH1)
-    if not ml_master_df.empty:
-        ml_master_df.columns = [str(c).strip() for c in ml_master_df.columns]
-        st.caption(f"✅ Loaded Maths Lab Excel with {ml_master_df.shape[0]} rows and {ml_master_df.shape[1]} columns")
-    else:
-        st.info("ℹ️ Maths Lab Excel loaded but is empty — Maths Lab reports will be skipped.")
-else:
-    st.info("ℹ️ No Maths Lab Excel provided — Maths Lab reports will be skipped.")
-
-# Build school options (from canonical columns)
-schools_df = master_df[["SchoolName", "ShortCode"]].dropna().drop_duplicates()
-school_options = sorted(
-    [f"{row.ShortCode} — {row.SchoolName}" for _, row in schools_df.iterrows()],
-    key=lambda s: s.split(" — ", 1)[-1].lower()
-)
+school_options = directory["school_options"]
 
 # --- School selection (reactive) ---
+# Long lists: filter first so the picker never hydrates thousands of options
+if len(school_options) > SCHOOL_FILTER_THRESHOLD:
+    school_query = st.text_input("Filter schools", key="school_filter").strip().casefold()
+    matches = [s for s in school_options if school_query in s.casefold()]
+    school_options = matches[:SCHOOL_FILTER_LIMIT]
+    if len(matches) > SCHOOL_FILTER_LIMIT:
+        st.caption(f"Showing {SCHOOL_FILTER_LIMIT} of {len(matches)} schools — type to narrow the list.")
+
 school_choice = st.selectbox("School", ["— Select a school —"] + school_options, index=0, key="school_select")
 if school_choice == "— Select a school —":
     st.info("Pick a school to load Classes (Levels) and continue.")
@@ -134,59 +304,31 @@ if school_choice == "— Select a school —":
 # Resolve selected school fields  (⚠️ no extra indentation here)
 short_code = school_choice.split(" — ", 1)[0].strip()
 
-# Filter Maths Lab rows for this school (tolerant column name)
+# --- Maths Lab rows for this school (optional; only loaded once a school is picked) ---
 ml_school_rows = pd.DataFrame()
-if not ml_master_df.empty:
-    ml_short_col = pick_col_ci(ml_master_df, "School Short Code", "ShortCode", "Short Code", "SchoolShortCode")
-    if ml_short_col:
-        ml_school_rows = ml_master_df[
-            ml_master_df[ml_short_col].astype(str).str.strip().str.casefold()
-            == short_code.strip().casefold()
-        ].copy()
-    else:
+if EXCEL_PATH1 and os.path.exists(EXCEL_PATH1):
+    ml_mtime = file_mtime(EXCEL_PATH1)
+    ml_rows = session_rows("ml", ml_mtime, short_code,
+                           lambda: load_ml_for(EXCEL_PATH1, ml_mtime, short_code))
+    if ml_rows is None:
         st.warning("Maths Lab Excel: couldn’t find a Short Code column; skipping Maths Lab mapping for this school.")
-
-# Resolve main school row and all rows for this school (canonical columns)
-school_row = schools_df[schools_df["ShortCode"].astype(str).str.strip().str.casefold()
-                        == short_code.strip().casefold()].iloc[0]
-
-school_name = str(school_row.SchoolName).strip()
-school_rows = master_df[master_df["ShortCode"].astype(str).str.strip().str.casefold()
-                        == short_code.strip().casefold()].copy()
-school_rows.columns = [str(c).strip() for c in school_rows.columns]
-
-
-
-
-# ---------- Build grade labels by scanning SubjectCode columns ----------
-base_label = (
-    school_rows["GradeLabel"].dropna().astype(str).str.strip().iloc[0]
-    if "GradeLabel" in school_rows.columns and not school_rows["GradeLabel"].dropna().empty
-    else "Grade"
-)
-# Add this for Maths Lab file (may be empty if file absent)
-# ml_school_rows = pd.DataFrame()
-# if not ml_master_df.empty:
-    # ml_school_rows = ml_master_df[ml_master_df["ShortCode"] == short_code].copy()
-    # ml_school_rows.columns = [str(c).strip() for c in ml_school_rows.columns]
-
-
-indices_with_data = []
-for i in range(1, SUBJECT_MAX + 1):
-    col = f"SubjectCode {i}"
-    if col in school_rows.columns:
-        vals = school_rows[col].dropna().astype(str).str.strip()
-        if not vals.empty and any(v for v in vals if v and v.lower() != "nan"):
-            indices_with_data.append(i)
-
-if indices_with_data:
-    start_idx = min(indices_with_data)
-    end_idx   = max(indices_with_data)
+    elif ml_rows.empty:
+        st.info(f"ℹ️ Maths Lab Excel has no rows for {short_code} — Maths Lab reports will be skipped.")
+    else:
+        ml_school_rows = ml_rows
+        st.caption(f"✅ Loaded Maths Lab Excel: {ml_rows.shape[0]} row(s) for {short_code}")
 else:
-    start_idx, end_idx = 1, 12  # fallback
+    st.info("ℹ️ No Maths Lab Excel provided — Maths Lab reports will be skipped.")
 
-grade_labels = [f"{base_label} {i}" for i in range(start_idx, end_idx + 1)]
-label_to_code = {f"{base_label} {i}": f"{i:02d}" for i in range(start_idx, end_idx + 1)}
+# Resolve main school row, its rows and grade labels (cached per workbook version + school)
+ctx = derive_school_context(EXCEL_PATH, master_mtime, short_code)
+school_name   = ctx["school_name"]
+school_rows   = ctx["school_rows"]
+base_label    = ctx["base_label"]
+start_idx     = ctx["start_idx"]
+end_idx       = ctx["end_idx"]
+grade_labels  = ctx["grade_labels"]
+label_to_code = ctx["label_to_code"]
 
 st.caption(f"Detected levels for {short_code}: {start_idx} → {end_idx} ({base_label})")
 
@@ -200,7 +342,12 @@ with st.form("cfg"):
         end = st.date_input("End date", value=date.today())
 
     st.markdown("### Classes (Levels)")
-    chosen_labels = st.multiselect("Select grades", grade_labels, default=grade_labels)
+    # "Select all" instead of pre-filling every chip keeps the widget (and session state) light
+    all_grades = st.checkbox("Select all grades", value=True)
+    chosen_labels = st.multiselect("Select grades", grade_labels, default=[],
+                                   help="Used when 'Select all grades' is unticked.")
+    if all_grades:
+        chosen_labels = grade_labels
     levels = [{"code": label_to_code[lbl], "name": lbl} for lbl in chosen_labels]
 
     need_class_reports = st.checkbox("Need Class & Student Reports", value=False)  # no sidebar
@@ -240,10 +387,11 @@ if submitted:
 
     subject_map_by_level = {}
     missing = []
+    subject_codes = subject_codes_wide(school_rows, range(start_idx, end_idx + 1))
     for lv in levels:
         lbl = lv["name"]
         code = lv["code"]
-        uuid = subject_for_grade_wide(school_rows, lbl)
+        uuid = subject_codes.get(code, "")
         if uuid:
             subject_map_by_level[code] = uuid
         else:
@@ -257,10 +405,11 @@ if submitted:
     ml_subject_map_by_level = {}
     ml_missing = []
     if not ml_school_rows.empty:
+        ml_subject_codes = subject_codes_wide(ml_school_rows, range(start_idx, end_idx + 1))
         for lv in levels:
             lbl = lv["name"]
             code = lv["code"]
-            uuid = subject_for_grade_wide(ml_school_rows, lbl)
+            uuid = ml_subject_codes.get(code, "")
             if uuid:
                 ml_subject_map_by_level[code] = uuid
             else:
@@ -282,9 +431,17 @@ if submitted:
     cfg["needClassReports"] = bool(need_class_reports)
 
 
-    with open("config.json", "w", encoding="utf-8") as f:
-        json.dump(cfg, f, indent=2)
-    st.success("config.json saved.")
+    # Skip identical rewrites; otherwise write a temp file and swap it in atomically
+    # so the runner can never read a half-written config
+    payload = json.dumps(cfg, indent=2).encode("utf-8")
+    cfg_path = Path("config.json")
+    if cfg_path.exists() and cfg_path.read_bytes() == payload:
+        st.success("config.json unchanged.")
+    else:
+        tmp_path = cfg_path.with_name("config.json.tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, cfg_path)
+        st.success("config.json saved.")
     st.code(json.dumps(cfg, indent=2), language="json")
 
 # ========= Run + Download THIS run =========
@@ -316,12 +473,9 @@ st.markdown("### Run the reports")
 if "run_id" not in st.session_state:
     st.session_state["run_id"] = ""
 
-# Compute a candidate run id (used when the user clicks Run now)
-candidate_run_id = f"{short_code}_{safe_date_str(start)}_{safe_date_str(end)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-
 if st.button("Run now"):
-    # Lock the run_id for this execution and future downloads
-    st.session_state["run_id"] = candidate_run_id
+    # Lock the run_id for this execution and future downloads (timestamped only on click)
+    st.session_state["run_id"] = f"{short_code}_{safe_date_str(start)}_{safe_date_str(end)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     try:
         # This portion works for windows and ubuntu but not streamlit cloud
         # result = subprocess.run(
@@ -333,19 +487,26 @@ if st.button("Run now"):
         # )
         outdir = str(OUTDIR_BASE)  # /tmp/report_outputs on Cloud
 
-        result = subprocess.run(
+        proc = subprocess.Popen(
             [sys.executable, "-u", "test_runner_all.py",
              "--config", "config.json",
              "--outdir", outdir,
              "--run-id", st.session_state["run_id"]],
-            capture_output=True, text=True, check=False
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
         )
 
-        st.text_area("Output", result.stdout + "\n" + result.stderr, height=320)
-        if result.returncode == 0:
+        # Stream output live; only the last LOG_TAIL_LINES lines are kept in memory
+        log_area = st.empty()
+        lines = deque(maxlen=LOG_TAIL_LINES)
+        for line in proc.stdout:
+            lines.append(line)
+            log_area.code("".join(lines), language="text")
+        proc.wait()
+
+        if proc.returncode == 0:
             st.success(f"Finished. Run ID: {st.session_state['run_id']}")
         else:
-            st.error(f"Script exited with code {result.returncode}.")
+            st.error(f"Script exited with code {proc.returncode}.")
     except Exception as e:
         st.error(f"Failed to run: {e}")
 
@@ -353,45 +514,54 @@ if st.button("Run now"):
 st.divider()
 st.markdown("### Download current run")
 
-# Use the last successful run if available; otherwise show the candidate
-run_id = st.session_state.get("run_id") or candidate_run_id
+# Only a run started from this session has anything to download
+run_id = st.session_state.get("run_id", "")
 
 # This portion works for windows and ubuntu but not streamlit cloud
 #run_folder = Path("report_outputs") / run_id
 
 run_folder = OUTDIR_BASE / run_id
 
-if run_folder.exists():
+if run_id and run_folder.exists():
     files = sorted(list(run_folder.glob("*.csv")) + list(run_folder.glob("*.xls")) + list(run_folder.glob("*.xlsx")))
     if not files:
         st.info("No files were generated in this run.")
     else:
-        # A) Per-file buttons with proper MIME
-        for p in files:
-            ext = p.suffix.lower()
-            mime = "text/csv" if ext == ".csv" else ("application/vnd.ms-excel" if ext == ".xls" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            with p.open("rb") as fh:
-                st.download_button(
-                    label=f"Download {p.name}",
-                    data=fh.read(),
-                    file_name=p.name,
-                    mime=mime,
-                    key=f"dl-{p.name}"
-                )
+        # A) All-in-one ZIP for this run (CSV + XLS/XLSX) — rebuilt only when the files change
+        stats = {p: p.stat() for p in files}
+        zip_sig = (run_id, tuple((p.name, s.st_mtime_ns, s.st_size) for p, s in stats.items()))
+        if st.session_state.get("zip_sig") != zip_sig:
+            mem = io.BytesIO()
+            with zipfile.ZipFile(mem, "w", zipfile.ZIP_STORED) as zf:
+                for p in files:
+                    # .xlsx is already a zip: store it; level-1 deflate gets most of the CSV win cheaply
+                    if p.suffix.lower() == ".xlsx":
+                        zf.writestr(p.name, p.read_bytes(), compress_type=zipfile.ZIP_STORED)
+                    else:
+                        zf.writestr(p.name, p.read_bytes(), compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+            st.session_state["zip_bytes"] = mem.getvalue()
+            st.session_state["zip_sig"] = zip_sig
 
-        # B) All-in-one ZIP for this run (CSV + XLS/XLSX)
-        mem = io.BytesIO()
-        with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
-            for p in files:
-                zf.write(str(p), arcname=p.name)
-
-        mem.seek(0)
         st.download_button(
             "Download THIS run as ZIP",
-            data=mem,
+            data=st.session_state["zip_bytes"],
             file_name=f"{run_id}.zip",
             mime="application/zip",
             key="zip-current-run"
         )
+
+        # B) Per-file buttons with proper MIME — each button holds its file's bytes
+        #    for the page's lifetime, so they are only read when asked for
+        if st.toggle(f"Show individual files ({len(files)})", key="dl-individual"):
+            for p in files:
+                ext = p.suffix.lower()
+                mime = "text/csv" if ext == ".csv" else ("application/vnd.ms-excel" if ext == ".xls" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                st.download_button(
+                    label=f"Download {p.name}",
+                    data=p.read_bytes(),
+                    file_name=p.name,
+                    mime=mime,
+                    key=f"dl-{p.name}"
+                )
 else:
     st.info("Run the reports to enable downloads for this run.")
@@ -10,61 +10,115 @@
 
 import argparse
 import csv
+import functools
 import json
 import os
 import re
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # optional; much faster than stdlib json on big report payloads
+except ImportError:
+    orjson = None
 
 # =========================
 # Logging + small utilities
 # =========================
 
-def _supports_utf8() -> bool:
-    enc = (getattr(__import__('sys').stdout, "encoding", "") or "").lower()
-    return "utf" in enc
+# stdout.encoding can be None (pipes on some platforms) -> treat as non-UTF-8
+_UTF8 = "utf" in (getattr(sys.stdout, "encoding", "") or "").lower()
+
+OK   = "✅" if _UTF8 else "[OK]"
+WARN = "⚠️" if _UTF8 else "[WARN]"
+ERR  = "❌" if _UTF8 else "[ERR]"
+ARROW = "→" if _UTF8 else "->"   # for logs only
+
+_PRINT_LOCK = threading.Lock()
+
+def log(*args):
+    """print() that keeps lines whole when report runs log from worker threads."""
+    with _PRINT_LOCK:
+        print(*args)
+
+def json_loads(data):
+    """json.loads for str or bytes; uses orjson when installed."""
+    return orjson.loads(data) if orjson else json.loads(data)
 
-OK   = "✅" if _supports_utf8() else "[OK]"
-WARN = "⚠️" if _supports_utf8() else "[WARN]"
-ERR  = "❌" if _supports_utf8() else "[ERR]"
-ARROW = "→" if _supports_utf8() else "->"   # for logs only
+def json_dumps(obj) -> str:
+    """Pretty JSON text (indent=2, non-ASCII kept); uses orjson when installed."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, indent=2, ensure_ascii=False)
 
 CLASS_CODE_RE = re.compile(r"\b\d{2}[A-Z]\d\b")  # e.g., 04A0
+_SCI_RE = re.compile(r"\d+(?:\.\d+)?[Ee][+-]?\d+")   # 01E0, 1.2E+05 ...
+_SECTIONS_SPLIT_RE = re.compile(r"[;,\n]+")
+_LABEL_STRIP_RE = re.compile(r"^[ :\-–—]+")
+_UNDERSCORE_RE = re.compile(r"_{2,}")
+
+_SANITIZE_TABLE = str.maketrans({"/": "-", "\\": "-", ":": "-", "*": "-", "?": "-",
+                                 '"': "'", "<": "(", ">": ")", "|": "-"})
+_DATE_TABLE = str.maketrans({"/": "-", "\\": "-", ":": "-"})
 
 def sanitize_filename(name: str) -> str:
     """Make a filename safe for most filesystems (keep spaces/dashes)."""
-    return (name.replace("/", "-").replace("\\", "-").replace(":", "-")
-                .replace("*", "-").replace("?", "-").replace('"', "'")
-                .replace("<", "(").replace(">", ")").replace("|", "-"))
+    return name.translate(_SANITIZE_TABLE)
 
 def add_school_suffix(file_name: str, school: str) -> str:
     """Append school name for clarity, if present."""
     if not school:
         return file_name
-    root, ext = os.path.splitext(file_name)
-    return f"{root}_{sanitize_filename(school)}{ext}"
+    suffix = sanitize_filename(school)
+    i = file_name.rfind(".")  # names are bare templates (no dirs), so the last dot is the extension
+    return f"{file_name[:i]}_{suffix}{file_name[i:]}" if i > 0 else f"{file_name}_{suffix}"
 
 def safe_date_for_name(d: str) -> str:
     """Convert DD/MM/YYYY → DD-MM-YYYY (for filenames)."""
-    return d.replace("/", "-").replace("\\", "-").replace(":", "-")
+    return d.translate(_DATE_TABLE)
 
 def strip_double_pipes(s: str) -> str:
     return s.strip().replace("||", " ").strip().strip("|")
 
 def excel_text_guard(s: str) -> str:
     """Prevent Excel scientific notation like 01E0 or 1.2E+05 by forcing text."""
-    if re.fullmatch(r"\d+(?:\.\d+)?[Ee][+-]?\d+", s):
+    if len(s) < 3 or ("E" not in s and "e" not in s):  # shortest match is "1E5"
+        return s
+    if _SCI_RE.fullmatch(s):
         return f'="{s}"'
     return s
 
-def clean_value(v):
-    """Normalize strings for Excel & remove mojibake."""
+CLEAN_MOJIBAKE = False  # True = always repair mojibake per cell too (normally done once per response)
+
+def repair_body_mojibake(body: bytes):
+    """
+    Undo double-encoded UTF-8 ('MÃ¼ller' for 'Müller') once on a whole response body.
+    Returns (body, needs_cell_repair): the second item is True when the body could not be
+    fixed cleanly in one go (mixed/escaped text), so clean_value() must repair per cell.
+    """
+    if b"\\u00c3" in body or b"\\u00C3" in body:   # JSON-escaped 'Ã': only visible after parsing
+        return body, True
+    if b"\xc3\x83" not in body:                     # no 'Ã' at all: nothing to repair
+        return body, False
+    if b"\xef\xbf\xbd" in body:                     # '�' somewhere: leave it to the per-cell check
+        return body, True
+    try:
+        return body.decode("utf-8").encode("latin-1").decode("utf-8"), False
+    except UnicodeError:
+        return body, True
+
+def clean_value(v, repair_mojibake: bool = CLEAN_MOJIBAKE):
+    """Normalize strings for Excel (and repair mojibake if asked)."""
     if isinstance(v, str):
         s = v.strip()
-        if "Ã" in s and "�" not in s:  # repair common mojibake when possible
+        if repair_mojibake and "Ã" in s and "�" not in s:  # repair common mojibake when possible
             try:
                 s = s.encode("latin-1").decode("utf-8")
             except Exception:
@@ -74,15 +128,38 @@ def clean_value(v):
         return s
     return v
 
-def clean_row(row: dict) -> dict:
-    return {k: clean_value(v) for k, v in row.items()}
+class _CleanedStrings(dict):
+    """str -> clean_value(str), filled on first lookup."""
+    def __init__(self, repair_mojibake: bool):
+        super().__init__()
+        self.repair_mojibake = repair_mojibake
+
+    def __missing__(self, s):
+        cleaned = self[s] = clean_value(s, self.repair_mojibake)
+        return cleaned
+
+def clean_columns(fieldnames: list, rows: list, repair_mojibake: bool = False):
+    """
+    Clean report cells column by column and return the CSV rows (missing keys -> "").
+    Columns repeat the same strings a lot (names, codes, dates), so each distinct
+    string goes through clean_value() once per file instead of once per cell.
+    """
+    if not fieldnames:
+        return ([] for _ in rows)
+    cleaned = _CleanedStrings(repair_mojibake)
+    columns = [[cleaned[v] if isinstance(v, str) else v for v in (row.get(k, "") for row in rows)]
+               for k in fieldnames]
+    return zip(*columns)
 
 def decode_maybe_json(value):
     """If a value looks JSON-encoded (stringified), keep json.loads-ing until it's a dict/list."""
     while isinstance(value, str):
+        s = value.strip()
+        if not s or s[0] not in '[{"':  # "04A0", dates, "false": not worth a parse attempt
+            break
         try:
-            value = json.loads(value)
-        except json.JSONDecodeError:
+            value = json_loads(s)
+        except ValueError:  # json / orjson decode errors both subclass ValueError
             break
     return value
 
@@ -100,27 +177,51 @@ def runs_teacher_reports_from_ml_map():
 # Excel: discover sections + friendly label map
 # ============================================
 
+try:
+    from python_calamine import CalamineWorkbook  # Rust reader, much faster than openpyxl
+except ImportError:
+    CalamineWorkbook = None
+
+def iter_first_sheet(xlsx_path: str):
+    """Stream the first sheet's rows as value sequences (calamine if installed, else openpyxl read-only)."""
+    if CalamineWorkbook is not None:
+        yield from CalamineWorkbook.from_path(xlsx_path).get_sheet_by_index(0).iter_rows()
+        return
+    from openpyxl import load_workbook
+    wb = load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
 def load_sections_and_labels(xlsx_path: str, school_short_code: str):
     """
     Returns (codes, labels_map) where labels_map maps '04A0' -> 'Grade 4 TPP Group 1'.
     Parses 'Class_Sections' for the given ShortCode. Tolerates separators and " - "/":".
+    Scans rows only until the school is found; no DataFrame is built.
     """
+    target = str(school_short_code).upper()
+    raw = None
     try:
-        df = pd.read_excel(xlsx_path, sheet_name=0)
+        rows = iter_first_sheet(xlsx_path)
+        header = [str(c).strip() for c in next(rows, ())]
+        if "ShortCode" not in header or "Class_Sections" not in header:
+            print(f"{WARN} Excel must have columns 'ShortCode' and 'Class_Sections'. Found: {header}")
+            return [], {}
+        sc_idx, cs_idx = header.index("ShortCode"), header.index("Class_Sections")
+        for r in rows:
+            if len(r) > sc_idx and r[sc_idx] is not None and str(r[sc_idx]).upper() == target:
+                raw = str((r[cs_idx] if len(r) > cs_idx else None) or "")
+                break
+        rows.close()
     except Exception as e:
         print(f"{WARN} Could not read sections Excel '{xlsx_path}': {e}")
         return [], {}
-    df.columns = [str(c).strip() for c in df.columns]
-    if "ShortCode" not in df.columns or "Class_Sections" not in df.columns:
-        print(f"{WARN} Excel must have columns 'ShortCode' and 'Class_Sections'. Found: {df.columns.tolist()}")
-        return [], {}
-    row = df[df["ShortCode"].astype(str).str.upper() == str(school_short_code).upper()]
-    if row.empty:
+    if raw is None:
         print(f"{WARN} No row for school '{school_short_code}' in sections Excel.")
         return [], {}
 
-    raw = str(row.iloc[0]["Class_Sections"] or "")
-    parts = re.split(r"[;,\n]+", raw)
+    parts = _SECTIONS_SPLIT_RE.split(raw)
     labels, codes, seen = {}, [], set()
     for part in parts:
         part = part.strip()
@@ -130,7 +231,7 @@ def load_sections_and_labels(xlsx_path: str, school_short_code: str):
         if not m:
             continue
         code = m.group(0)
-        label = part[m.end():].lstrip(" :-–—").strip() or f"Class {code}"
+        label = _LABEL_STRIP_RE.sub("", part[m.end():]).strip() or f"Class {code}"
         labels[code] = label
         if code not in seen:
             seen.add(code); codes.append(code)
@@ -146,40 +247,53 @@ def load_sections_and_labels(xlsx_path: str, school_short_code: str):
 
 SECTION_LABEL_MAP = {}  # filled at runtime
 
-def inject_class_and_dates(template_name: str, class_code: str, start_label: str, end_label: str,
-                           grade_label_map: dict = None) -> str:
+# Every template token, substituted in one pass (see inject_class_and_dates)
+_TEMPLATE_TOKEN_RE = re.compile("|".join(map(re.escape, (
+    "<class>", "(class)",
+    "<start_date>", "(start_date)", "<SAFE_START>", "(SAFE_START)",
+    "<end_date>", "(end_date)", "<SAFE_END>", "(SAFE_END)",
+))))
+
+@functools.lru_cache(maxsize=None)
+def resolve_class_label(class_code: str) -> str:
     """
-    Replace <class>, <start_date>, <end_date> in template_name with friendly values.
-    Also supports legacy <SAFE_START>/<SAFE_END> and (SAFE_START)/(SAFE_END).
-    Class label preference:
+    Friendly label for a class code ("" for no class). Preference:
       1) SECTION_LABEL_MAP['04A0'] → 'Grade 4 TPP Group 1'
       2) grade_label_map[class_code] or grade_label_map[:2]
       3) 'Class 04A0'
+    Cached per code; call resolve_class_label.cache_clear() after changing either map.
     """
-    grade_label_map = grade_label_map or {}
-    if class_code:
-        human = (SECTION_LABEL_MAP.get(class_code)
-                 or grade_label_map.get(class_code)
-                 or grade_label_map.get(class_code[:2]))
-        class_label = human if human else f"Class {class_code}"
-    else:
-        class_label = ""
-
-    safe_name = (template_name
-                 .replace("<class>", class_label)
-                 .replace("(class)", (class_label + "_") if class_label else "")
-                 .replace("<start_date>", start_label).replace("(start_date)", start_label)
-                 .replace("<end_date>",   end_label).  replace("(end_date)",   end_label)
-                 .replace("<SAFE_START>", start_label).replace("(SAFE_START)", start_label)
-                 .replace("<SAFE_END>",   end_label).  replace("(SAFE_END)",   end_label))
+    if not class_code:
+        return ""
+    return (SECTION_LABEL_MAP.get(class_code)
+            or grade_label_map.get(class_code)
+            or grade_label_map.get(class_code[:2])
+            or f"Class {class_code}")
+
+def inject_class_and_dates(template_name: str, class_code: str, start_label: str, end_label: str) -> str:
+    """
+    Replace <class>, <start_date>, <end_date> in template_name with friendly values.
+    Also supports legacy <SAFE_START>/<SAFE_END> and (SAFE_START)/(SAFE_END).
+    The class label comes from resolve_class_label().
+    """
+    class_label = resolve_class_label(class_code)
+
+    tokens = {
+        "<class>": class_label,
+        "(class)": (class_label + "_") if class_label else "",
+        "<start_date>": start_label, "(start_date)": start_label,
+        "<SAFE_START>": start_label, "(SAFE_START)": start_label,
+        "<end_date>":   end_label,   "(end_date)":   end_label,
+        "<SAFE_END>":   end_label,   "(SAFE_END)":   end_label,
+    }
+    safe_name = _TEMPLATE_TOKEN_RE.sub(lambda m: tokens[m.group(0)], template_name)
 
     # Readability tweaks
     if class_label and f"{class_label}{start_label}" in safe_name:
         safe_name = safe_name.replace(f"{class_label}{start_label}", f"{class_label}_{start_label}")
     if start_label + end_label in safe_name:
         safe_name = safe_name.replace(start_label + end_label, f"{start_label}_{end_label}")
-    while "__" in safe_name:
-        safe_name = safe_name.replace("__", "_")
+    safe_name = _UNDERSCORE_RE.sub("_", safe_name)
     return safe_name
 
 # ==========================
@@ -230,18 +344,32 @@ def ensure_rows(values):
             return None
     return list(union_keys), fixed_rows
 
+def parse_params_template(report: dict):
+    """
+    Parse the JSON-like params string of a report definition once, at load time.
+    Placeholders (<class>, <start_date>, ...) stay inside the string values. An invalid
+    template is kept as its decode error so build_params() can report it per run.
+    """
+    param_str = report.get("params", "")
+    try:
+        report["_params_template"] = json_loads("{" + param_str + "}") if param_str else {}
+    except json.JSONDecodeError as e:
+        report["_params_template"] = e
+
 def build_params(report: dict, class_code: str, subject_code: str) -> dict:
     """
-    Expand JSON-like params string in report definition into a dict with placeholders filled.
+    Fill the pre-parsed params template of a report definition with this run's values.
     Also backfills SQR's assessmentType if missing.
     """
-    param_str = report.get("params", "")
-    param_str = (param_str.replace("<start_date>", START_DATE)
-                           .replace("<end_date>", END_DATE)
-                           .replace("<class>", class_code or "")
-                           .replace("<subject>", subject_code or "")
-                           .replace("<mlsubject>", subject_code or ""))
-    params = json.loads("{" + param_str + "}") if param_str else {}
+    template = report["_params_template"]
+    if isinstance(template, Exception):
+        raise template
+    params = {k: (v.replace("<start_date>", START_DATE)
+                   .replace("<end_date>", END_DATE)
+                   .replace("<class>", class_code or "")
+                   .replace("<subject>", subject_code or "")
+                   .replace("<mlsubject>", subject_code or "")) if isinstance(v, str) else v
+              for k, v in template.items()}
 
     # Safety: SQR requires assessmentType=1 in many deployments
     if report.get("name") == "Student Quiz Performance Report" and "assessmentType" not in params:
@@ -263,6 +391,11 @@ args = parser.parse_args()
 with open("report_def_final.json", "r", encoding="utf-8") as f:
     defs = json.load(f)
 reports = defs["reports"] if isinstance(defs, dict) and "reports" in defs else defs
+reports_by_name = {}
+for r in reports:
+    parse_params_template(r)
+    reports_by_name.setdefault(r["name"], r)  # first definition wins on duplicate names
+all_report_names = list(reports_by_name)
 
 # Load portal config
 with open(args.config, "r", encoding="utf-8") as f:
@@ -321,6 +454,7 @@ if NEED_CLASS:
     SECTION_CODES = [c for c in codes if (not selected_levels or c[:2] in selected_levels)]
 else:
     print("[INFO] Class reports disabled in config; skipping per-class sections.")
+resolve_class_label.cache_clear()  # labels are final from here on
 
 print("Selected grade codes:", ", ".join(sorted(selected_levels)) or "(none)")
 print("Sections taken for Class reports:", ", ".join(SECTION_CODES) or "(none)")
@@ -361,8 +495,10 @@ OTHER_REPORTS = [
 ]
 
 # Auto-include any custom "Class ..." reports defined in JSON
-CLASS_REPORTS = [r["name"] for r in reports if str(r.get("name","")).startswith("Class ")]
-OTHER_REPORTS += [n for n in CLASS_REPORTS if n not in OTHER_REPORTS]
+CLASS_REPORTS = frozenset(n for n in all_report_names if str(n).startswith("Class "))
+OTHER_REPORTS += [n for n in all_report_names if n in CLASS_REPORTS and n not in OTHER_REPORTS]
+# Reports that only run with needClassReports (all "Class ..." reports + SQR; CQR removed)
+NEED_CLASS_REPORTS = CLASS_REPORTS | {"Student Quiz Performance Report"}
 
 # Where to extract rows from the JSON payload
 EXTRACT_MAP = {
@@ -443,7 +579,7 @@ RUN_PLAN = {
 }
 
 # Include any custom "Class ..." reports from JSON
-for name in [r for r in [r["name"] for r in reports] if str(r).startswith("Class ")]:
+for name in CLASS_REPORTS:
     RUN_PLAN[name] = [({"code": c}, {}) for c in (SECTION_CODES or [])] or [({}, {})]
 
 # ================================
@@ -461,22 +597,41 @@ RUN_MANIFEST = {
     "files": []
 }
 
+def build_meta(report_name: str, report: dict, file_path: str, class_code: str, subject_code: str,
+               row_count: int, window: tuple = None) -> dict:
+    """Sidecar/manifest entry for one saved CSV. `window` = (start, end) overrides the run dates (SQR)."""
+    start_date, end_date = window or (START_DATE, END_DATE)
+    return {
+        "reportName": report_name,
+        "fileName": os.path.basename(file_path),
+        "filePath": file_path,
+        "url": report["url"], "method": report["method"],
+        "classCode": class_code, "subjectCode": subject_code,
+        "startDate": start_date, "endDate": end_date,
+        "savedAt": datetime.now().isoformat(timespec="seconds"),
+        "rowCount": row_count,
+        "classLabel": resolve_class_label(class_code),
+    }
+
 def write_sidecar_meta(path: str, meta: dict):
     sidecar = path + ".meta.json"
     try:
         with open(sidecar, "w", encoding="utf-8") as f:
-            json.dump(meta, f, indent=2)
+            f.write(json_dumps(meta))
     except Exception as e:
-        print(f"{WARN} Could not write sidecar for {path}: {e}")
+        log(f"{WARN} Could not write sidecar for {path}: {e}")
+
+_MANIFEST_LOCK = threading.Lock()
 
 def add_to_run_manifest(entry: dict):
-    RUN_MANIFEST["files"].append(entry)
+    with _MANIFEST_LOCK:
+        RUN_MANIFEST["files"].append(entry)
 
 def finalise_run_manifest():
     try:
         manifest_path = os.path.join(output_dir, "run_manifest.json")
         with open(manifest_path, "w", encoding="utf-8") as f:
-            json.dump(RUN_MANIFEST, f, indent=2, ensure_ascii=False)
+            f.write(json_dumps(RUN_MANIFEST))
 
         # print without emoji (Windows safe)
         print(f"[OK] Wrote run manifest: {manifest_path}")
@@ -488,22 +643,209 @@ def finalise_run_manifest():
 # Main runner
 # ============
 
-all_report_names = [r["name"] for r in reports]
 def _close_matches(name, all_names):
     import difflib as _dl
     return _dl.get_close_matches(name, all_names, n=3, cutoff=0.5)
 
+MAX_WORKERS = max(1, int(config.get("maxWorkers", 12) or 1))
+
+# One pooled session for every request (keep-alive instead of a TLS handshake per call).
+# The pool must hold a connection per worker; transient gateway errors are retried,
+# and the final response is still returned (not raised) so it gets logged as before.
+session = requests.Session()
+session.headers.update(headers)
+session.cookies.update(cookies)
+_adapter = HTTPAdapter(
+    pool_connections=16, pool_maxsize=max(32, MAX_WORKERS),
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False),
+)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+SQR_PROBE_URL = "https://report.heymath.com/reports/generateReport.action"
+SQR_FTD_RE = re.compile(r"\s*(\d{2}/\d{2}/\d{2,4})\s*-\s*(\d{2}/\d{2}/\d{2,4})\s*")
+_SQR_WINDOW_CACHE = {}   # school short code -> (site_start, today_str)
+_SQR_WINDOW_LOCK = threading.Lock()
+
+def sqr_site_window(class_code: str):
+    """
+    (site academic start, today) as DD/MM/YYYY strings, or None if the probe finds nothing.
+    The window is school-wide, so the first successful probe is reused for every section;
+    the lock makes concurrent SQR jobs wait for it instead of all probing at once.
+    """
+    key = school_short_code or "_"
+    with _SQR_WINDOW_LOCK:
+        if key in _SQR_WINDOW_CACHE:
+            return _SQR_WINDOW_CACHE[key]
+        today = datetime.now()
+        # Probe a wide window (Jan 1 → today) so the server returns the school’s academic start
+        probe_params = {
+            "timePeriod": "predefined",
+            "startDate": f"01/01/{today.strftime('%Y')}",
+            "endDate": today.strftime("%d/%m/%Y"),
+            "levelSection": class_code,
+        }
+        try:
+            probe = session.get(SQR_PROBE_URL, params=probe_params, timeout=20)
+            obj = decode_maybe_json(json_loads(probe.content) if (probe.headers.get("Content-Type","").startswith("application/json")) else probe.text)
+            data = obj.get("data") if isinstance(obj, dict) else obj
+            payload = decode_maybe_json(data)
+            items = []
+            if isinstance(payload, dict):
+                for bucket in ("newData","oldData"):
+                    b = payload.get(bucket)
+                    if isinstance(b, dict):
+                        items.extend(list(b.values()))
+            if items:
+                items.sort(key=lambda it: int(it.get("createdDate", 0)), reverse=True)
+                m = SQR_FTD_RE.match(str(items[0].get("fromToDate") or ""))
+                if m:
+                    # academic start as the site uses it
+                    _SQR_WINDOW_CACHE[key] = (m.group(1), today.strftime("%d/%m/%Y"))
+                    return _SQR_WINDOW_CACHE[key]
+        except Exception:
+            pass
+        return None  # not cached: the next section probes again
+
+# One disk writer: report threads hand their CSV off and go straight back to the network
+io_pool = ThreadPoolExecutor(max_workers=1)
+IO_FUTURES = []
+
+def write_report_csv(file_path: str, fieldnames: list, rows: list, meta: dict, cell_mojibake: bool = False):
+    """Write one report CSV (header-only when rows is empty), its sidecar, and its manifest entry."""
+    try:
+        with open(file_path, "w", newline="", encoding="utf-8-sig", buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            writer.writerows(clean_columns(fieldnames, rows, cell_mojibake))
+    except Exception as e:
+        log(f"{ERR} Error in report [{meta['reportName']}]: could not write {file_path}: {e}")
+        return
+    log(f"{OK} Saved to {file_path}" if rows else f"{WARN} Saved header-only CSV to {file_path}")
+    write_sidecar_meta(file_path, meta)
+    add_to_run_manifest(meta)
+
+def run_one(report_name: str, report: dict, class_level: dict, subject: dict):
+    """Fetch one (report, class, subject) run and write its CSV + sidecar; safe to run in a worker thread."""
+    try:
+        class_code   = (class_level or {}).get("code", "")
+        subject_code = (subject or {}).get("code", "")
+
+        # Build params with placeholders replaced (adds SQR assessmentType if missing)
+        try:
+            params = build_params(report, class_code, subject_code)
+        except json.JSONDecodeError as e:
+            log(f"{WARN} JSON decode error in params for [{report_name}]: {e}")
+            return
+
+        # Filename date labels (SQR may override with site window)
+        use_start_label = SAFE_START
+        use_end_label   = SAFE_END
+
+        # --- SQR: preflight to get site academic start + today, then override params + labels
+        if report_name == "Student Quiz Performance Report":
+            window = sqr_site_window(class_code)
+            if window:
+                site_start, today_str = window
+                params["startDate"] = site_start
+                params["endDate"]   = today_str
+                use_start_label     = safe_date_for_name(site_start)
+                use_end_label       = safe_date_for_name(today_str)
+            log(f"[SQR] {class_code}: using site window {params.get('startDate')} , {params.get('endDate')}")
+
+        # Reflect the site window in meta for SQR
+        meta_window = None
+        if report_name == "Student Quiz Performance Report":
+            meta_window = (params.get("startDate", START_DATE), params.get("endDate", END_DATE))
+
+        # --- Make the request for the report itself
+        response = session.request(
+            method=report["method"],
+            url=report["url"],
+            params=params if report["method"].upper() == "GET" else None,
+            timeout=30,
+        )
+
+        log(f"{OK} {report_name} [{class_code or '-'} | {subject_code or '-'}]: Status {response.status_code}")
+        if response.status_code != 200:
+            log(f"{WARN} Response content:", response.text[:240])
+            return
+
+        # --- Robust JSON parse + normalize double-encoded payloads
+        body, cell_mojibake = repair_body_mojibake(response.content)
+        cell_mojibake = cell_mojibake or CLEAN_MOJIBAKE
+        try:
+            resp_obj = json_loads(body)  # bytes straight in, no text decode
+        except Exception:
+            raw = response.content
+            try:
+                text = raw.decode("utf-8", errors="strict")
+            except UnicodeDecodeError:
+                response.encoding = "utf-8"
+                text = response.text
+            if "Ã" in text and "�" not in text:
+                try:
+                    text = text.encode("latin-1").decode("utf-8", errors="ignore")
+                except Exception:
+                    pass
+            try:
+                resp_obj = json.loads(text)
+            except Exception:
+                log(f"{ERR} Could not parse response as JSON at all.")
+                return
+        resp_obj = decode_maybe_json(resp_obj)
+
+        # --- Generic extraction (CSV writers for all non-CQR)
+        values = extract_values(report_name, resp_obj)
+        values = decode_maybe_json(values)
+        ensured = ensure_rows(values)
+
+        # header-only CSV if server returns explicit empty list
+        if not ensured:
+            if isinstance(values, list) and len(values) == 0:
+                # Avoid NameError if EXPECTED_HEADERS is not defined in this file
+                fieldnames = (globals().get("EXPECTED_HEADERS", {}) or {}).get(report_name, [])
+                template = report.get("outputFile") or report.get("outfile") or f"{report_name}.csv"
+                safe_name = sanitize_filename(template)
+                safe_name = inject_class_and_dates(safe_name, class_code, use_start_label, use_end_label)
+                safe_name = add_school_suffix(safe_name, school_name)
+                file_path = os.path.join(output_dir, safe_name)
+                meta = build_meta(report_name, report, file_path, class_code, subject_code, 0, meta_window)
+                IO_FUTURES.append(io_pool.submit(write_report_csv, file_path, list(fieldnames), [], meta))
+                return
+
+            # otherwise nothing usable
+            keys = list(resp_obj.keys()) if isinstance(resp_obj, dict) else type(resp_obj)
+            log(f"{WARN} No usable rows. Keys/type: {keys}")
+            log(" Sample:", (str(resp_obj)[:240] if not isinstance(resp_obj, dict)
+                            else str({k: str(resp_obj[k])[:120] for k in list(resp_obj)[:2]})))
+            return
+
+        # normal CSV with rows
+        fieldnames, rows = ensured
+        fieldnames = list(fieldnames)
+
+        template = report.get("outputFile") or report.get("outfile") or f"{report_name}.csv"
+        safe_name = sanitize_filename(template)
+        safe_name = inject_class_and_dates(safe_name, class_code, use_start_label, use_end_label)
+        safe_name = add_school_suffix(safe_name, school_name)
+        file_path = os.path.join(output_dir, safe_name)
+
+        meta = build_meta(report_name, report, file_path, class_code, subject_code, len(rows), meta_window)
+        IO_FUTURES.append(io_pool.submit(write_report_csv, file_path, fieldnames, rows, meta, cell_mojibake))
+
+    except Exception as e:
+        log(f"{ERR} Error in report [{report_name}]: {e}")
+
+# Build the job list (gating + lookups stay sequential), then fan the HTTP work out
+jobs = []
 for report_name in TABLE_DATA_REPORTS + OTHER_REPORTS:
-    # Gate all "Class ..." reports behind the checkbox
-    if report_name in CLASS_REPORTS and not NEED_CLASS:
-        print(f"[INFO] Skipping {report_name} because needClassReports=False")
-        continue
-    # Gate SQR too (CQR removed)
-    if report_name in {"Student Quiz Performance Report"} and not NEED_CLASS:
+    # Gate all "Class ..." reports and SQR behind the checkbox
+    if not NEED_CLASS and report_name in NEED_CLASS_REPORTS:
         print(f"[INFO] Skipping {report_name} because needClassReports=False")
         continue
 
-    report = next((r for r in reports if r["name"] == report_name), None)
+    report = reports_by_name.get(report_name)
     if not report:
         print(f"{ERR} Report not found in config: {report_name}")
         suggestions = _close_matches(report_name, all_report_names)
@@ -512,188 +854,17 @@ for report_name in TABLE_DATA_REPORTS + OTHER_REPORTS:
         continue
 
     runs = RUN_PLAN.get(report_name, [({}, {})])
-
-    for class_level, subject in runs:
-        try:
-            class_code   = (class_level or {}).get("code", "")
-            subject_code = (subject or {}).get("code", "")
-
-            # Build params with placeholders replaced (adds SQR assessmentType if missing)
-            try:
-                params = build_params(report, class_code, subject_code)
-            except json.JSONDecodeError as e:
-                print(f"{WARN} JSON decode error in params for [{report_name}]: {e}")
-                continue
-
-            # Filename date labels (SQR may override with site window)
-            use_start_label = SAFE_START
-            use_end_label   = SAFE_END
-
-            # --- SQR: preflight to get site academic start + today, then override params + labels
-            if report_name == "Student Quiz Performance Report":
-                base = "https://report.heymath.com/reports/generateReport.action"
-                today = datetime.now()
-                # Probe a wide window (Jan 1 → today) so the server returns the school’s academic start
-                probe_params = {
-                    "timePeriod": "predefined",
-                    "startDate": f"01/01/{today.strftime('%Y')}",
-                    "endDate": today.strftime("%d/%m/%Y"),
-                    "levelSection": class_code,
-                }
-                try:
-                    probe = requests.get(base, params=probe_params, headers=headers, cookies=cookies, timeout=20)
-                    obj = decode_maybe_json(probe.json() if (probe.headers.get("Content-Type","").startswith("application/json")) else probe.text)
-                    data = obj.get("data") if isinstance(obj, dict) else obj
-                    payload = decode_maybe_json(data)
-                    items = []
-                    if isinstance(payload, dict):
-                        for bucket in ("newData","oldData"):
-                            b = payload.get(bucket)
-                            if isinstance(b, dict):
-                                items.extend(list(b.values()))
-                    if items:
-                        items.sort(key=lambda it: int(it.get("createdDate", 0)), reverse=True)
-                        ftd = str(items[0].get("fromToDate") or "")
-                        m = re.match(r"\s*(\d{2}/\d{2}/\d{2,4})\s*-\s*(\d{2}/\d{2}/\d{2,4})\s*", ftd)
-                        if m:
-                            site_start = m.group(1)  # academic start as the site uses it
-                            today_str = today.strftime("%d/%m/%Y")
-                            params["startDate"] = site_start
-                            params["endDate"]   = today_str
-                            use_start_label     = safe_date_for_name(site_start)
-                            use_end_label       = safe_date_for_name(today_str)
-                except Exception:
-                    pass
-                print(f"[SQR] {class_code}: using site window {params.get('startDate')} , {params.get('endDate')}")
-
-            # --- Make the request for the report itself
-            response = requests.request(
-                method=report["method"],
-                url=report["url"],
-                headers=headers,
-                cookies=cookies,
-                params=params if report["method"].upper() == "GET" else None,
-                timeout=30,
-            )
-
-            print(f"{OK} {report_name} [{class_code or '-'} | {subject_code or '-'}]: Status {response.status_code}")
-            if response.status_code != 200:
-                print(f"{WARN} Response content:", response.text[:240])
-                continue
-
-            # --- Robust JSON parse + normalize double-encoded payloads
-            try:
-                resp_obj = response.json()
-            except Exception:
-                raw = response.content
-                try:
-                    text = raw.decode("utf-8", errors="strict")
-                except UnicodeDecodeError:
-                    response.encoding = "utf-8"
-                    text = response.text
-                if "Ã" in text and "�" not in text:
-                    try:
-                        text = text.encode("latin-1").decode("utf-8", errors="ignore")
-                    except Exception:
-                        pass
-                try:
-                    resp_obj = json.loads(text)
-                except Exception:
-                    print(f"{ERR} Could not parse response as JSON at all.")
-                    continue
-            resp_obj = decode_maybe_json(resp_obj)
-
-            # --- Generic extraction (CSV writers for all non-CQR)
-            values = extract_values(report_name, resp_obj)
-            values = decode_maybe_json(values)
-            ensured = ensure_rows(values)
-
-            # header-only CSV if server returns explicit empty list
-            if not ensured:
-                if isinstance(values, list) and len(values) == 0:
-                    # Avoid NameError if EXPECTED_HEADERS is not defined in this file
-                    fieldnames = (globals().get("EXPECTED_HEADERS", {}) or {}).get(report_name, [])
-                    template = report.get("outputFile") or report.get("outfile") or f"{report_name}.csv"
-                    safe_name = sanitize_filename(template)
-                    safe_name = inject_class_and_dates(safe_name, class_code, use_start_label, use_end_label, grade_label_map)
-                    safe_name = add_school_suffix(safe_name, school_name)
-                    file_path = os.path.join(output_dir, safe_name)
-                    with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
-                        writer = csv.DictWriter(f, fieldnames=fieldnames)
-                        writer.writeheader()
-                    print(f"{WARN} Saved header-only CSV to {file_path}")
-
-                    meta = {
-                        "reportName": report_name,
-                        "fileName": os.path.basename(file_path),
-                        "filePath": file_path,
-                        "url": report["url"], "method": report["method"],
-                        "classCode": class_code, "subjectCode": subject_code,
-                        "startDate": START_DATE, "endDate": END_DATE,
-                        "savedAt": datetime.now().isoformat(timespec="seconds"),
-                        "rowCount": 0,
-                        "classLabel": SECTION_LABEL_MAP.get(class_code) or
-                                      grade_label_map.get(class_code) or
-                                      grade_label_map.get(class_code[:2]) or
-                                      (f"Class {class_code}" if class_code else "")
-                    }
-                    # Reflect site window in meta for SQR
-                    if report_name == "Student Quiz Performance Report":
-                        meta["startDate"] = params.get("startDate", START_DATE)
-                        meta["endDate"]   = params.get("endDate", END_DATE)
-
-                    write_sidecar_meta(file_path, meta)
-                    add_to_run_manifest(meta)
-                    continue
-
-                # otherwise nothing usable
-                keys = list(resp_obj.keys()) if isinstance(resp_obj, dict) else type(resp_obj)
-                print(f"{WARN} No usable rows. Keys/type: {keys}")
-                print(" Sample:", (str(resp_obj)[:240] if not isinstance(resp_obj, dict)
-                                  else str({k: str(resp_obj[k])[:120] for k in list(resp_obj)[:2]})))
-                continue
-
-            # normal CSV with rows
-            fieldnames, rows = ensured
-            rows = [clean_row(r) for r in rows]
-
-            template = report.get("outputFile") or report.get("outfile") or f"{report_name}.csv"
-            safe_name = sanitize_filename(template)
-            safe_name = inject_class_and_dates(safe_name, class_code, use_start_label, use_end_label, grade_label_map)
-            safe_name = add_school_suffix(safe_name, school_name)
-            file_path = os.path.join(output_dir, safe_name)
-
-            with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.DictWriter(f, fieldnames=list(fieldnames))
-                writer.writeheader()
-                for row in rows:
-                    writer.writerow(row)
-
-            print(f"{OK} Saved to {file_path}")
-
-            meta = {
-                "reportName": report_name,
-                "fileName": os.path.basename(file_path),
-                "filePath": file_path,
-                "url": report["url"], "method": report["method"],
-                "classCode": class_code, "subjectCode": subject_code,
-                "startDate": START_DATE, "endDate": END_DATE,
-                "savedAt": datetime.now().isoformat(timespec="seconds"),
-                "rowCount": len(rows),
-                "classLabel": SECTION_LABEL_MAP.get(class_code) or
-                              grade_label_map.get(class_code) or
-                              grade_label_map.get(class_code[:2]) or
-                              (f"Class {class_code}" if class_code else "")
-            }
-            if report_name == "Student Quiz Performance Report":
-                meta["startDate"] = params.get("startDate", START_DATE)
-                meta["endDate"]   = params.get("endDate", END_DATE)
-
-            write_sidecar_meta(file_path, meta)
-            add_to_run_manifest(meta)
-
-        except Exception as e:
-            print(f"{ERR} Error in report [{report_name}]: {e}")
+    if not runs:  # e.g. no Maths Lab subject mapped for any selected level
+        continue
+    jobs.extend((report_name, report, class_level, subject) for class_level, subject in runs)
+
+print(f"Running {len(jobs)} report request(s) with up to {MAX_WORKERS} worker(s)")
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+    for future in as_completed([pool.submit(run_one, *job) for job in jobs]):
+        future.result()  # run_one logs its own errors; surface anything unexpected
+io_pool.shutdown(wait=True)  # every CSV/sidecar is on disk before the manifest is written
+for future in IO_FUTURES:
+    future.result()
 
 # Final manifest
 finalise_run_manifest()